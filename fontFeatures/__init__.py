@@ -530,6 +530,10 @@ class RoutineReference:
 
 class Rule:
     """A base class for all rules."""
+    # Rules are created in large numbers, so they (and their subclasses)
+    # carry no per-instance __dict__.
+    __slots__ = ()
+
     def asFea(self):
         """Returns this Rule as a string of AFDKO feature text."""
         return self.asFeaAST().asFea()
@@ -593,6 +597,11 @@ class Substitution(Rule):
           # by dotbelow-myanmar.post;
     """
 
+    __slots__ = (
+        "precontext", "postcontext", "input", "replacement", "address",
+        "lookups", "languages", "flags", "reverse", "stage", "force_alt",
+    )
+
     def __init__(
         self,
         input_,
@@ -664,6 +673,11 @@ class Chaining(Rule):
         ) # sub Q' lookup sub_Qu [u v u.sc v.sc];
     """
 
+    __slots__ = (
+        "precontext", "postcontext", "input", "address", "lookups",
+        "languages", "flags",
+    )
+
     def __init__(
         self,
         input_,
@@ -774,6 +788,11 @@ class Positioning(Rule):
         # pos [BEi1 BEi2]' <0 0 200 0> [sda sdb dda ddb]' <0 50 0 0> @medis_finas;
     """
 
+    __slots__ = (
+        "precontext", "postcontext", "glyphs", "valuerecords", "address",
+        "languages", "flags", "stage", "lookups",
+    )
+
     def __init__(
         self,
         glyphs,
@@ -850,6 +869,14 @@ class Attachment(Rule):
         tops = Attachment("top", "_top", top_bases, top_marks)
     """
 
+    # fontfeatures, baseslist and markslist are filled in later by the
+    # feaLib code when needed.
+    __slots__ = (
+        "base_name", "mark_name", "bases", "marks", "flags", "address",
+        "font", "stage", "languages", "force_markmark", "fontfeatures",
+        "baseslist", "markslist",
+    )
+
     def __init__(
         self,
         base_name,
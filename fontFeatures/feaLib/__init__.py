@@ -1,9 +1,32 @@
 import io
+import sys
+from itertools import islice
 import fontFeatures
 from fontTools.feaLib.parser import Parser
 import fontTools.feaLib.ast as ast
 from warnings import warn
 
+
+def _intern_glyphs(glyphs):
+    return [sys.intern(g) for g in glyphs]
+
+
+def _split_mapping(mapping):
+    # One pass over the mapping gives both sides of a single substitution
+    if not mapping:
+        return [], []
+    inputs, replacements = zip(*mapping.items())
+    return _intern_glyphs(inputs), _intern_glyphs(replacements)
+
+
+def _stringify_context(context):
+    # Glyph sets from feaLib are usually already tuples of glyph names
+    return [
+        _intern_glyphs(group if group and isinstance(group[0], str) else map(str, group))
+        for group in context
+    ]
+
+
 class FeaParser:
     """Turns a AFDKO feature file or string into a FontFeatures object.
 
@@ -17,6 +40,10 @@ class FeaParser:
         self.markclasses = {}
         self.currentFeature = None
         self.currentRoutine = None
+        self._routine_by_name = {}
+        self._flagsApplied = (None, None, 0)
+        self._location_cache = {}
+        self._markdict_cache = {}
         self.gensym = 1
         self.glyphmap = ()
         self.currentLanguage = None
@@ -57,18 +84,27 @@ class FeaParser:
         parsetree.build(self)
         return self.ff
 
+    def _fmt_location(self, location):
+        # Consecutive rules frequently share a source location
+        formatted = self._location_cache.get(location)
+        if formatted is None:
+            formatted = "%s:%i:%i" % (location)
+            self._location_cache[location] = formatted
+        return formatted
+
     def _start_routine_if_necessary(self, location):
         if not self.currentRoutine:
             self._start_routine(location, "")
 
     def _start_routine(self, location, name):
-        location = "%s:%i:%i" % (location)
+        location = self._fmt_location(location)
         # print("Starting routine at "+location)
         self._discard_empty_routine()
         self.currentRoutine = fontFeatures.Routine(name=name, address=location)
         if not name:
             self.currentRoutine.name = "unnamed_routine_%i" % self.gensym
             self.gensym = self.gensym + 1
+        self._routine_by_name.setdefault(self.currentRoutine.name, self.currentRoutine)
         self.currentRoutineFlag = 0
         if self.currentFeature:
             reference = self.ff.referenceRoutine(self.currentRoutine)
@@ -76,6 +112,14 @@ class FeaParser:
         else:
             self.ff.routines.append(self.currentRoutine)
 
+    def find_named_routine(self, name):
+        routine = self._routine_by_name.get(name)
+        if routine is None:
+            # Might be a routine which was already in the FontFeatures
+            # object before we started parsing (e.g. from FEE's Include)
+            routine = self.ff.routineNamed(name)
+        return routine
+
     def start_lookup_block(self, location, name):
         self._start_routine(location, name)
 
@@ -100,12 +144,13 @@ class FeaParser:
 
     def add_single_subst(self, location, prefix, suffix, mapping, forceChain):
         self._start_routine_if_necessary(location)
-        location = "%s:%i:%i" % (location)
+        location = self._fmt_location(location)
+        inputs, replacements = _split_mapping(mapping)
         s = fontFeatures.Substitution(
-            input_=[list(mapping.keys())],
-            replacement=[list(mapping.values())],
-            precontext= [[str(g) for g in group] for group in prefix],
-            postcontext= [[str(g) for g in group] for group in suffix],
+            input_=[inputs],
+            replacement=[replacements],
+            precontext=_stringify_context(prefix),
+            postcontext=_stringify_context(suffix),
             address=location,
             languages=self.currentLanguage
         )
@@ -114,12 +159,13 @@ class FeaParser:
 
     def add_reverse_chain_single_subst(self, location, prefix, suffix, mapping):
         self._start_routine_if_necessary(location)
-        location = "%s:%i:%i" % (location)
+        location = self._fmt_location(location)
+        inputs, replacements = _split_mapping(mapping)
         s = fontFeatures.Substitution(
-            input_=[list(mapping.keys())],
-            replacement=[list(mapping.values())],
-            precontext= [[str(g) for g in group] for group in prefix],
-            postcontext= [[str(g) for g in group] for group in suffix],
+            input_=[inputs],
+            replacement=[replacements],
+            precontext=_stringify_context(prefix),
+            postcontext=_stringify_context(suffix),
             address=location,
             languages=self.currentLanguage,
             reverse=True
@@ -130,12 +176,12 @@ class FeaParser:
         self, location, prefix, glyph, suffix, replacements, forceChain
     ):
         self._start_routine_if_necessary(location)
-        location = "%s:%i:%i" % (location)
+        location = self._fmt_location(location)
         s = fontFeatures.Substitution(
             input_=[[glyph]],
             replacement=[[g] for g in replacements],
-            precontext= [[str(g) for g in group] for group in prefix],
-            postcontext= [[str(g) for g in group] for group in suffix],
+            precontext=_stringify_context(prefix),
+            postcontext=_stringify_context(suffix),
             address=location,
             languages=self.currentLanguage
         )
@@ -143,12 +189,12 @@ class FeaParser:
 
     def add_alternate_subst(self, location, prefix, glyph, suffix, replacement):
         self._start_routine_if_necessary(location)
-        location = "%s:%i:%i" % (location)
+        location = self._fmt_location(location)
         s = fontFeatures.Substitution(
             input_=[[glyph]],
             replacement=[replacement],
-            precontext= [[str(g) for g in group] for group in prefix],
-            postcontext= [[str(g) for g in group] for group in suffix],
+            precontext=_stringify_context(prefix),
+            postcontext=_stringify_context(suffix),
             address=location,
             languages=self.currentLanguage
         )
@@ -158,12 +204,12 @@ class FeaParser:
         self, location, prefix, glyphs, suffix, replacement, forceChain
     ):
         self._start_routine_if_necessary(location)
-        location = "%s:%i:%i" % (location)
+        location = self._fmt_location(location)
         s = fontFeatures.Substitution(
             input_=[list(x) for x in glyphs],
             replacement=[[replacement]],
-            precontext= [[str(g) for g in group] for group in prefix],
-            postcontext= [[str(g) for g in group] for group in suffix],
+            precontext=_stringify_context(prefix),
+            postcontext=_stringify_context(suffix),
             address=location,
             languages=self.currentLanguage
         )
@@ -171,18 +217,16 @@ class FeaParser:
 
     def add_chain_context_subst(self, location, prefix, glyphs, suffix, lookups):
         self._start_routine_if_necessary(location)
-        location = "%s:%i:%i" % (location)
+        location = self._fmt_location(location)
         # Find named feature
-        mylookups = []
-        for x in lookups:
-            if x:
-                mylookups.append([self.ff.routineNamed(y.name) for y in x])
-            else:
-                mylookups.append(None)
+        mylookups = [
+            [self.find_named_routine(y.name) for y in x] if x else None
+            for x in lookups
+        ]
         s = fontFeatures.Chaining(
             input_=[list(x) for x in glyphs],
-            precontext= [[str(g) for g in group] for group in prefix],
-            postcontext= [[str(g) for g in group] for group in suffix],
+            precontext=_stringify_context(prefix),
+            postcontext=_stringify_context(suffix),
             lookups=mylookups,
             address=location,
             languages=self.currentLanguage
@@ -193,12 +237,12 @@ class FeaParser:
 
     def add_single_pos(self, location, prefix, suffix, pos, forceChain):
         self._start_routine_if_necessary(location)
-        location = "%s:%i:%i" % (location)
+        location = self._fmt_location(location)
         s = fontFeatures.Positioning(
             glyphs=[p[0] for p in pos],
             valuerecords=[p[1] for p in pos],
-            precontext= [[str(g) for g in group] for group in prefix],
-            postcontext= [[str(g) for g in group] for group in suffix],
+            precontext=_stringify_context(prefix),
+            postcontext=_stringify_context(suffix),
             address=location,
             languages=self.currentLanguage
         )
@@ -206,7 +250,7 @@ class FeaParser:
 
     def add_specific_pair_pos(self, location, glyph1, value1, glyph2, value2):
         self._start_routine_if_necessary(location)
-        location = "%s:%i:%i" % (location)
+        location = self._fmt_location(location)
         s = fontFeatures.Positioning(
             glyphs=[[glyph1], [glyph2]], valuerecords=[value1, value2], address=location,
             languages=self.currentLanguage
@@ -215,7 +259,7 @@ class FeaParser:
 
     def add_class_pair_pos(self, location, glyphclass1, value1, glyphclass2, value2):
         self._start_routine_if_necessary(location)
-        location = "%s:%i:%i" % (location)
+        location = self._fmt_location(location)
         s = fontFeatures.Positioning(
             glyphs=[glyphclass1, glyphclass2],
             valuerecords=[value1, value2],
@@ -226,7 +270,7 @@ class FeaParser:
 
     def add_cursive_pos(self, location, glyphclass, entryAnchor, exitAnchor):
         self._start_routine_if_necessary(location)
-        location = "%s:%i:%i" % (location)
+        location = self._fmt_location(location)
         basedict, markdict = {}, {}
         if entryAnchor:
             basedict = {g: (entryAnchor.x, entryAnchor.y) for g in glyphclass}
@@ -244,17 +288,22 @@ class FeaParser:
 
     def add_mark_base_pos(self, location, bases, marks):
         self._start_routine_if_necessary(location)
-        location = "%s:%i:%i" % (location)
+        location = self._fmt_location(location)
         for baseanchor, markclass in marks:
             assert len(markclass.definitions) == 1
             markanchor = markclass.definitions[0].anchor
+            # The same mark class turns up in many statements; build its
+            # glyph->anchor dict once and hand each rule its own copy.
+            key = (markclass, markanchor.x, markanchor.y)
+            markdict = self._markdict_cache.get(key)
+            if markdict is None:
+                markdict = dict.fromkeys(markclass.glyphs.keys(), (markanchor.x, markanchor.y))
+                self._markdict_cache[key] = markdict
             s = fontFeatures.Attachment(
                 base_name=markclass.name,
                 mark_name=markclass.name,
-                bases={g: (baseanchor.x, baseanchor.y) for g in bases},
-                marks={
-                    g: (markanchor.x, markanchor.y) for g in markclass.glyphs.keys()
-                },
+                bases=dict.fromkeys(bases, (baseanchor.x, baseanchor.y)),
+                marks=markdict.copy(),
                 address=location,
             languages=self.currentLanguage
             )
@@ -278,35 +327,51 @@ class FeaParser:
 
     def add_lookup_call(self, lookup_name):
 
-        routine = self.ff.routineNamed(lookup_name)
+        routine = self.find_named_routine(lookup_name)
         if self.currentFeature:
             self._discard_empty_routine()
             self.ff.addFeature(self.currentFeature, [routine])
         else:
             raise ValueError("Huh?")
 
+    def _apply_routine_flag(self):
+        # Only touch rules added since the last time this routine was swept
+        # with the same flag value.
+        routine, flag = self.currentRoutine, self.currentRoutineFlag
+        lastRoutine, lastFlag, done = self._flagsApplied
+        if routine is not lastRoutine or flag != lastFlag:
+            done = 0
+        for rule in islice(routine.rules, done, None):
+            rule.flags = flag
+        self._flagsApplied = (routine, flag, len(routine.rules))
+
     def end_lookup_block(self):
         if self.currentRoutine:
-            for rule in self.currentRoutine.rules:
-                rule.flags = self.currentRoutineFlag
+            self._apply_routine_flag()
 
     def end_feature(self):
         self._discard_empty_routine()
         self.currentFeature = None
         self.currentLanguage = None
         if self.currentRoutine:
-            for rule in self.currentRoutine.rules:
-                rule.flags = self.currentRoutineFlag
+            self._apply_routine_flag()
             self.currentRoutine = None
 
     def _discard_empty_routine(self):
         if not self.currentFeature:
             return
         if self.currentRoutine and not self.currentRoutine.rules:
-            if self.currentRoutine not in  self.ff.routines:
+            routines = self.ff.routines
+            # The current routine is almost always the last one appended
+            if routines and routines[-1] is self.currentRoutine:
+                routines.pop()
+            elif self.currentRoutine not in routines:
                 # print("%s escaped!" % self.currentRoutine.name)
                 return
-            del(self.ff.routines[self.ff.routines.index(self.currentRoutine)])
+            else:
+                del(routines[routines.index(self.currentRoutine)])
+            if self._routine_by_name.get(self.currentRoutine.name) is self.currentRoutine:
+                del(self._routine_by_name[self.currentRoutine.name])
             if self.currentFeature in self.ff.features:
                 del(self.ff.features[self.currentFeature][-1])
         pass
@@ -109,8 +109,12 @@ will take any glyph selector and display its contents on standard error.
 """
 
 import lark
+import operator
 import re
-from glyphtools import get_glyph_metrics, bin_glyphs_by_metric
+import sys
+from itertools import chain
+import numpy as np
+from glyphtools import get_glyph_metrics, ckmeans
 
 import warnings
 
@@ -127,7 +131,7 @@ predicate: has_glyph_predicate | has_anchor_predicate | category_predicate | met
 negated_predicate: "not" predicate
 
 CONJUNCTOR: "&" | "|" | "-"
-primary_action: glyphselector | conjunction | predicate | negated_predicate
+?primary_action: glyphselector | conjunction | predicate | negated_predicate
 primary: primary_action | ("(" primary_action ")")
 conjunction: primary CONJUNCTOR primary
 
@@ -146,9 +150,30 @@ action: CLASSNAME "[" METRIC "," NUMBER "]" "=" primary
 PARSEOPTS = dict(use_helpers=True)
 VERBS = ["DefineClass", "DefineClassBinned"]
 
+class MetricComparison:
+    """A predicate testing a glyph metric against a value.
+
+    Called with a glyph's metrics and name like any other predicate, but can
+    also be applied to an array holding the metric for many glyphs at once."""
+    COMPARATORS = {">=": operator.ge, "<=": operator.le, "==": operator.eq, "<": operator.lt, ">": operator.gt}
+
+    def __init__(self, metric, comparator, value):
+        self.metric = metric
+        self.comparator = comparator
+        self.value = value
+
+    def __call__(self, metrics, glyphname):
+        return compare(metrics[self.metric], self.comparator, self.value)
+
+    def mask(self, values):
+        # Same semantics as util.compare, which treats a zero value as truthiness
+        if not self.value:
+            return values.astype(bool)
+        return self.COMPARATORS[self.comparator](values, self.value)
+
 class DefineClass(FEEVerb):
     def _add_glyphs_to_named_class(self, glyphs, classname):
-        self.parser.fontfeatures.namedClasses[classname] = glyphs
+        self.parser.fontfeatures.namedClasses[classname] = [sys.intern(str(g)) for g in glyphs]
 
     def has_glyph_predicate(self, args):
         glyphre, withs = args
@@ -164,7 +189,10 @@ class DefineClass(FEEVerb):
         return {"predicate": "category", "value": barename.value, "inverted": False}
 
     def _get_metrics(self, glyph, metric=None):
-        metrics = get_glyph_metrics(self.parser.font, glyph)
+        cache = self.parser.glyph_metrics_cache
+        if glyph not in cache:
+            cache[glyph] = get_glyph_metrics(self.parser.font, glyph)
+        metrics = cache[glyph]
         if metric is not None:
             if metric not in TESTVALUE_METRICS:
                 raise ValueError("Unknown metric '%s'" % metric)
@@ -177,7 +205,7 @@ class DefineClass(FEEVerb):
         (metric, comparator, comp_value) = args
         metric = metric.value
         comparator = comparator.value
-        return lambda metrics, glyphname: compare(metrics[metric], comparator, comp_value)
+        return MetricComparison(metric, comparator, comp_value)
 
     def predicate(self, args):
         (predicate,) = args
@@ -191,9 +219,6 @@ class DefineClass(FEEVerb):
         (predicate,) = args
         return lambda metrics, glyphname: not predicate(metrics, glyphname)
 
-    def primary_action(self, args):
-        return args[0]
-
     def primary(self, args):
         (primary,) = args
         if isinstance(primary, GlyphSelector) or (isinstance(primary, dict) and "conjunction" in primary):
@@ -203,8 +228,26 @@ class DefineClass(FEEVerb):
             glyphs = self._predicate_for_all_glyphs(primary)
             return glyphs
 
+    def _glyph_order(self):
+        if self.parser.glyph_order is None:
+            self.parser.glyph_order = tuple(self.parser.font.glyphOrder)
+        return self.parser.glyph_order
+
+    def _metric_array(self, metric):
+        arrays = self.parser.metric_arrays
+        if metric not in arrays:
+            arrays[metric] = np.array([self._get_metrics(g, metric) for g in self._glyph_order()])
+        return arrays[metric]
+
     def _predicate_for_all_glyphs(self, predicate):
-        all_glyphs = list(self.parser.font.glyphOrder)
+        all_glyphs = self._glyph_order()
+        if isinstance(predicate, MetricComparison):
+            values = self._metric_array(predicate.metric)
+            # Metrics such as lsb are None for glyphs without outlines; leave
+            # those to util.compare rather than comparing an object array.
+            if values.dtype != object:
+                mask = predicate.mask(values)
+                return [all_glyphs[i] for i in np.nonzero(mask)[0]]
         return [g for g in all_glyphs if predicate(self._get_metrics(g), g)]
 
     def conjunction(self, args):
@@ -227,14 +270,15 @@ class DefineClass(FEEVerb):
     @classmethod
     def resolve_definition(self, parser, primary):
         if isinstance(primary, dict) and "conjunction" in primary:
-            left = set(primary["left"])
-            right = set(primary["right"])
+            # Keep glyph order stable: left operand first, then right
+            left = dict.fromkeys(primary["left"])
             if primary["conjunction"] == "or":
-                return list(left | right)
-            elif primary["conjunction"] == "and":
-                return list(left & right)
+                return list(dict.fromkeys(chain(left, primary["right"])))
+            right = set(primary["right"])
+            if primary["conjunction"] == "and":
+                return [g for g in left if g in right]
             else: #subtract
-                return set(left) - set(right)
+                return [g for g in left if g not in right]
         else:
             return primary.resolve(parser.fontfeatures, parser.font)
 
@@ -248,18 +292,35 @@ class DefineClass(FEEVerb):
             cat = predicate["value"]
             truth = parser.font[glyphname].category == cat
         elif metric == "hasglyph":
-            truth = re.sub(predicate["value"]["replace"], predicate["value"]["with"], glyphname) in parser.font
+            if parser.glyph_names is None:
+                parser.glyph_names = frozenset(parser.font.keys())
+            replaced = predicate["value"]["replace"].sub(predicate["value"]["with"], glyphname)
+            truth = replaced in parser.glyph_names
         else:
             raise ValueError("Unknown metric {}".format(metric))
         return truth
 
 class DefineClassBinned(DefineClass):
+    def _bin_glyphs(self, glyphs, metric, bincount):
+        # Same clustering as glyphtools.bin_glyphs_by_metric, but using the
+        # parser's metrics cache and set lookups for cluster membership.
+        metrics = {g: self._get_metrics(g, metric) for g in glyphs}
+        clusters = ckmeans(list(metrics.values()), min(bincount, len(metrics)))
+        # ckmeans can split equal values over several clusters when there
+        # are more bins than distinct values; as in glyphtools, a glyph then
+        # belongs to every cluster containing its value.
+        binned = []
+        for cluster in clusters:
+            members = set(cluster)
+            binned.append([g for g, v in metrics.items() if v in members])
+        return binned
+
     def action(self, args):
         # glyphs is already resolved, because this class has functions of DefineClass, which resolves `primary`
         classname, (metric, bincount), glyphs = args[0], (args[1].value, args[2].value), args[3]
-        binned = bin_glyphs_by_metric(self.parser.font, glyphs, metric, bincount=int(bincount))
+        binned = self._bin_glyphs(glyphs, metric, int(bincount))
         for i in range(1, int(bincount) + 1):
-            self.parser.fontfeatures.namedClasses["%s_%s%i" % (classname, metric, i)] = tuple(binned[i - 1][0])
+            self.parser.fontfeatures.namedClasses["%s_%s%i" % (classname, metric, i)] = tuple(binned[i - 1])
 
         return classname, (metric, bincount), glyphs
 
@@ -1,4 +1,4 @@
-import warnings
+import sys
 
 from . import FEEVerb
 from fontFeatures.feeLib import GlyphSelector
@@ -17,24 +17,28 @@ VERBS = ["ShowClass", "DumpClassNames", "DumpClasses"]
 
 class DumpClasses(FEEVerb):
     def action(self, _):
-        for c in self.parser.fontfeatures.namedClasses:
-            ShowClass(self.parser).action((GlyphSelector({"classname":c}, [], None),))
+        shower = ShowClass(self.parser)
+        lines = [
+            shower.describe(GlyphSelector({"classname":c}, [], None))
+            for c in self.parser.fontfeatures.namedClasses
+        ]
+        sys.stderr.write("".join("# %s\n" % line for line in lines))
         return
 
 class DumpClassNames(FEEVerb):
     def action(self, _):
-        warnings.warn(" ".join(self.parser.fontfeatures.namedClasses))
+        print("# %s" % " ".join(self.parser.fontfeatures.namedClasses), file=sys.stderr)
 
         return
 
 class ShowClass(FEEVerb):
+    def describe(self, classname):
+        return "%s = %s" % (
+            classname.as_text(),
+            " ".join(classname.resolve(self.parser.fontfeatures, self.parser.font)),
+        )
+
     def action(self, args):
         (classname,) = args
-        warnings.warn(
-            "%s = %s"
-            % (
-                classname.as_text(),
-                " ".join(classname.resolve(self.parser.fontfeatures, self.parser.font)),
-            )
-        )
+        print("# %s" % self.describe(classname), file=sys.stderr)
         return
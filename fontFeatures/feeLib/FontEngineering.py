@@ -77,6 +77,8 @@ class SetWidth(FEEVerb):
             else:
                 glyph.width = width
         self.parser.font_modified = True
+        self.parser.glyph_metrics_cache.clear()
+        self.parser.metric_arrays.clear()
         return []
 
 class DuplicateGlyphs:
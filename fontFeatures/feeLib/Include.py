@@ -13,7 +13,7 @@ import lark
 
 import os
 
-PARSEOPTS = dict(use_helpers=True)
+PARSEOPTS = dict(use_helpers=True, parser="lalr")
 GRAMMAR = """
 ?start: action
 action: ESCAPED_STRING
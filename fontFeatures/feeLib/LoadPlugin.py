@@ -1,6 +1,6 @@
 import lark
 
-PARSEOPTS = dict(use_helpers=True)
+PARSEOPTS = dict(use_helpers=True, parser="lalr")
 
 # We need a Python package name here, but a bare glyph name looks
 # just like one.
@@ -12,7 +12,7 @@ Examples::
 
 import lark
 
-PARSEOPTS = dict(use_helpers=True)
+PARSEOPTS = dict(use_helpers=True, parser="lalr")
 
 GRAMMAR = """
     ?start: action
@@ -1,14 +1,16 @@
 import lark
 
-import collections
+import mmap
+import os
 import pathlib
 import re
+import stat
 import warnings
 
 from importlib import import_module
+from itertools import chain, repeat
 from fontFeatures import FontFeatures
 from babelfont.font import Font
-from more_itertools import collapse
 from fontFeatures.variableScalar import VariableScalar
 
 def warning_on_one_line(message, category, filename, lineno, file=None, line=None):
@@ -17,8 +19,72 @@ def warning_on_one_line(message, category, filename, lineno, file=None, line=Non
 
 warnings.formatwarning = warning_on_one_line
 
+# Glyph name tests for regex selectors, keyed by pattern string. The same
+# selectors tend to be resolved many times over during a parse.
+_REGEX_CACHE = {}
+
+_REGEX_SPECIALS = frozenset(".^$*+?{}[]\\|()")
+
+
+def _literal_matcher(regex):
+    """Return a plain string test equivalent to a literal-ish regex, or None.
+
+    Selectors such as ``/^uni1E/`` or ``/\\.sc$/`` don't need the regex
+    engine at all; ``str.startswith`` and friends are much quicker."""
+    anchored_start = regex.startswith("^")
+    anchored_end = regex.endswith("$")
+    body = iter(regex[int(anchored_start) : len(regex) - int(anchored_end)])
+    literal = []
+    for c in body:
+        if c == "\\":
+            c = next(body, None)
+            if c not in _REGEX_SPECIALS:
+                return None
+        elif c in _REGEX_SPECIALS:
+            return None
+        literal.append(c)
+    literal = "".join(literal)
+    if not literal:
+        return None
+    if anchored_start and anchored_end:
+        return literal.__eq__
+    if anchored_start:
+        return lambda g: g.startswith(literal)
+    if anchored_end:
+        return lambda g: g.endswith(literal)
+    return lambda g: literal in g
+
+
+def _flatten(items):
+    # Statement results are (verb, result) tuples wrapping lists of rules;
+    # only lists and tuples ever need descending into.
+    for item in items:
+        if isinstance(item, (list, tuple)):
+            yield from _flatten(item)
+        else:
+            yield item
+
+
+def _font_cache(fontfeatures, font):
+    """Returns the running parse's lookup cache for a font.
+
+    A FeeParser makes its per-parse cache available through the scratch
+    space of its FontFeatures object while it is parsing; outside of a parse
+    there is no cache and None is returned."""
+    caches = fontfeatures.scratch.get("fee_font_caches")
+    if caches is None:
+        return None
+    # Fonts aren't hashable. Keeping the font in the entry stops its id
+    # being reused by another font while the entry is alive.
+    entry = caches.get(id(font))
+    if entry is None or entry[0] is not font:
+        entry = caches[id(font)] = (font, {})
+    return entry[1]
+
 
 class GlyphSelector:
+    __slots__ = ("selector", "suffixes", "location")
+
     def __init__(self, selector, suffixes, location):
         self.selector = selector
         self.suffixes = suffixes
@@ -51,19 +117,34 @@ class GlyphSelector:
             returned = returned + s["suffixtype"] + s["suffix"]
         return returned
 
-    def _apply_suffix(self, glyphname, suffix):
-        if suffix["suffixtype"] == ".":
-            glyphname = glyphname + "." + suffix["suffix"]
-        else:
-            if glyphname.endswith("." + suffix["suffix"]):
-                glyphname = glyphname[: -(len(suffix["suffix"]) + 1)]
-        return glyphname
+    def _expansion_key(self):
+        # Regex and range selectors depend only on the font, never on the
+        # class definitions made so far, so their expansions can be shared.
+        kind, value = next(iter(self.selector.items()))
+        if kind not in ("regex", "unicoderange"):
+            return None
+        return (kind, value)
+
+    def _exported_glyphs(self, fontcache, font):
+        # exportedGlyphs() walks every glyph in the font, which doesn't
+        # change under us while features are being parsed.
+        if fontcache is None:
+            glyphs = font.exportedGlyphs()
+            return glyphs, frozenset(glyphs)
+        if "exported_glyphs" not in fontcache:
+            glyphs = font.exportedGlyphs()
+            fontcache["exported_glyphs"] = (glyphs, frozenset(glyphs))
+        return fontcache["exported_glyphs"]
 
     def resolve(self, fontfeatures, font, mustExist=True):
         returned = []
         # assert isinstance(font, Font)
-        glyphs = font.exportedGlyphs()
-        if "barename" in self.selector:
+        fontcache = _font_cache(fontfeatures, font)
+        glyphs, glyphset = self._exported_glyphs(fontcache, font)
+        key = self._expansion_key() if fontcache is not None else None
+        if key is not None and key in fontcache:
+            returned = fontcache[key]
+        elif "barename" in self.selector:
             returned = [self.selector["barename"]]
         elif "unicodeglyph" in self.selector:
             cp = self.selector["unicodeglyph"]
@@ -75,21 +156,18 @@ class GlyphSelector:
                 )
             returned = [glyph]
         elif "unicoderange" in self.selector:
-            returned = list(
-                collapse(
-                    [
-                        GlyphSelector({"unicodeglyph": i}, (), self.location).resolve(fontfeatures, font)
-                        for i in self.selector["unicoderange"]
-                    ]
+            codepoints = self.selector["unicoderange"]
+            returned = list(map(font.glyphForCodepoint, codepoints, repeat(False)))
+            if None in returned:
+                raise ValueError(
+                    "Font does not contain glyph for U+%04X (at %s)"
+                    % (codepoints[returned.index(None)], self.location)
                 )
-            )
         elif "inlineclass" in self.selector:
             returned = list(
-                collapse(
-                    [
-                        GlyphSelector(i, (), self.location).resolve(fontfeatures, font)
-                        for i in self.selector["inlineclass"]
-                    ]
+                chain.from_iterable(
+                    GlyphSelector(i, (), self.location).resolve(fontfeatures, font)
+                    for i in self.selector["inlineclass"]
                 )
             )
         elif "classname" in self.selector:
@@ -102,21 +180,33 @@ class GlyphSelector:
             returned = fontfeatures.namedClasses[classname]
         elif "regex" in self.selector:
             regex = self.selector["regex"]
-            try:
-                pattern = re.compile(regex)
-            except Exception as e:
-                raise ValueError(
-                    "Couldn't parse regular expression '%s' at %s"
-                    % (regex, self.location)
-                )
-
-            returned = list(filter(lambda x: re.search(pattern, x), glyphs))
+            match = _REGEX_CACHE.get(regex)
+            if match is None:
+                match = _literal_matcher(regex)
+            if match is None:
+                try:
+                    match = re.compile(regex).search
+                except Exception as e:
+                    raise ValueError(
+                        "Couldn't parse regular expression '%s' at %s"
+                        % (regex, self.location)
+                    )
+            _REGEX_CACHE[regex] = match
+
+            returned = list(filter(match, glyphs))
+        if key is not None:
+            fontcache.setdefault(key, returned)
         for s in self.suffixes:
-            returned = [self._apply_suffix(g, s) for g in returned]
+            dotsuffix = "." + s["suffix"]
+            if s["suffixtype"] == ".":
+                returned = [g + dotsuffix for g in returned]
+            else:
+                trim = -len(dotsuffix)
+                returned = [g[:trim] if g.endswith(dotsuffix) else g for g in returned]
         if mustExist:
-            notFound = list(filter(lambda x: x not in glyphs, returned))
-            returned = list(filter(lambda x: x in glyphs, returned))
-            if len(notFound) > 0:
+            notFound = [x for x in returned if x not in glyphset]
+            if notFound:
+                returned = [x for x in returned if x in glyphset]
                 plural = ""
                 if len(notFound) > 1:
                     plural = "s"
@@ -185,20 +275,92 @@ HELPERS="""
     %ignore WS
 """.format(" | ".join(['"{}"'.format(tv) for tv in TESTVALUE_METRICS]))
 
+HELPERS_PLUS_GRAMMAR = HELPERS+GRAMMAR
+
 # These are options usable by plugins to affect parsing. It is recommended to
 # leave use_helpers True in almost all cases, unless you want to handle parsing
 # of arguments at a low level in your plugin. The helpers parse things like
 # glyph classes, regular expressions, etc. in a consistent way across different
 # plugins.
+#
+# Plugins may also set ``parser`` to "lalr" to have their verbs parsed with
+# Lark's LALR parser, which is much faster than the default Earley parser.
+# Only do this when the plugin's grammar is unambiguous *and* its terminals
+# cannot be confused by LALR's contextual lexer - for example, a metric name
+# like ``width`` is also a valid BARENAME, which Earley disambiguates but
+# LALR does not.
 PARSEOPTS = dict(use_helpers=True)
 
 class NullParser:
     def parse(*args, **kwargs):
         pass
 
+# Building a Lark parser is expensive, and every FeeParser registers the same
+# plugins, so compiled parsers are shared between instances.
+_compiled_grammars = {}
+
+def _compile_grammar(grammar, parser="earley"):
+    key = (grammar, parser)
+    if key not in _compiled_grammars:
+        if parser == "lalr":
+            _compiled_grammars[key] = lark.Lark(grammar, parser="lalr", lexer="contextual", maybe_placeholders=False)
+        else:
+            _compiled_grammars[key] = lark.Lark(grammar, parser=parser)
+    return _compiled_grammars[key]
+
+# Full grammar strings for each plugin verb. Keeping hold of the strings
+# means every later registration looks up the compiled parser with the very
+# same (already hashed) string, instead of concatenating a fresh copy of the
+# helpers for each verb of each FeeParser.
+_plugin_grammars = {}
+
+def _verb_grammars(mod, verb):
+    key = (mod, verb)
+    if key not in _plugin_grammars:
+        rules = HELPERS+mod.GRAMMAR if mod.PARSEOPTS["use_helpers"] else mod.GRAMMAR
+        verb_grammar = getattr(mod, verb+"_GRAMMAR", None)
+        verb_bbgrammar = getattr(mod, verb+"_beforebrace_GRAMMAR", None)
+        verb_abgrammar = getattr(mod, verb+"_afterbrace_GRAMMAR", None)
+        _plugin_grammars[key] = (
+            rules+verb_grammar if verb_grammar else rules,
+            rules+verb_bbgrammar if verb_bbgrammar else None,
+            rules+verb_abgrammar if verb_abgrammar else None,
+        )
+    return _plugin_grammars[key]
+
+# Parse trees for verbs given no arguments at all. These come out the same
+# every time, so there is no point lexing and parsing an empty string again.
+# Only the shared compiled parsers are cached; a NullParser is made for each
+# verb of each FeeParser and returns nothing anyway.
+_empty_parses = {}
+
+def _parse_args(parser, args):
+    if args:
+        return parser.parse(' '.join(args))
+    if not isinstance(parser, lark.Lark):
+        return parser.parse('')
+    if parser not in _empty_parses:
+        _empty_parses[parser] = parser.parse('')
+    return _empty_parses[parser]
+
 class Verb:
-    transformer = None
-    parser = None
+    __slots__ = ("parser", "bbparser", "abparser", "transformer", "transformer_instance")
+
+    def __init__(self):
+        self.parser = None
+        self.bbparser = None
+        self.abparser = None
+        self.transformer = None
+        self.transformer_instance = None
+
+    def get_transformer(self, parser):
+        # Verb transformers keep no state between statements, so one
+        # instance serves every statement using this verb. The plugin table
+        # is shared between FeeParsers, though, so check whose it is.
+        instance = self.transformer_instance
+        if instance is None or instance.parser is not parser:
+            self.transformer_instance = self.transformer(parser)
+        return self.transformer_instance
 
 class FeeParser:
     DEFAULT_PLUGINS = [
@@ -217,11 +379,23 @@ class FeeParser:
 
     plugins = dict()
     variables = dict()
-    current_file = pathlib.Path().absolute()
+    _current_file = None
 
-    parser = lark.Lark(HELPERS+GRAMMAR)
+    @property
+    def current_file(self):
+        # Until a file is parsed, includes are looked up from the working
+        # directory. Work that out when it's first needed, not at import.
+        if self._current_file is None:
+            self._current_file = pathlib.Path().absolute()
+        return self._current_file
+
+    @current_file.setter
+    def current_file(self, filename):
+        self._current_file = filename
 
     def __init__(self, font):
+        # Compiled on first use rather than at import time
+        self.parser = _compile_grammar(HELPERS_PLUS_GRAMMAR)
         for p in self.DEFAULT_PLUGINS:
             self.load_plugin(p)
 
@@ -231,6 +405,17 @@ class FeeParser:
         self.fontfeatures.setGlyphClassesFromFont(self.font)
         self.current_feature = None
         self.font_modified = False
+        self.font_caches = {}
+        self._reset_font_caches()
+
+    def _reset_font_caches(self):
+        # Everything looked up from the font, which is only trusted for the
+        # length of one parse; the font may be edited between calls.
+        self.glyph_metrics_cache = {}
+        self.metric_arrays = {}
+        self.glyph_names = None
+        self.glyph_order = None
+        self.font_caches.clear()
 
     def load_plugin(self, plugin) -> bool:
         if "." not in plugin:
@@ -250,26 +435,20 @@ class FeeParser:
     def register_plugin(self, mod, plugin) -> bool:
         verbs = getattr(mod, "VERBS")
         popts = getattr(mod, "PARSEOPTS")
-        rules = HELPERS+mod.GRAMMAR if popts["use_helpers"] else mod.GRAMMAR
+        parser = popts.get("parser", "earley")
 
         for v in verbs:
             verb = Verb()
-            verb_grammar = getattr(mod, v+"_GRAMMAR", None)
-            verb_bbgrammar = getattr(mod, v+"_beforebrace_GRAMMAR", None)
-            verb_abgrammar = getattr(mod, v+"_afterbrace_GRAMMAR", None)
-
-            if verb_grammar:
-                verb.parser = lark.Lark(rules+verb_grammar)
-            else:
-                verb.parser = lark.Lark(rules)
+            grammar, bbgrammar, abgrammar = _verb_grammars(mod, v)
+            verb.parser = _compile_grammar(grammar, parser)
 
-            if verb_bbgrammar:
-                verb.bbparser = lark.Lark(rules+verb_bbgrammar)
+            if bbgrammar:
+                verb.bbparser = _compile_grammar(bbgrammar, parser)
             else:
                 verb.bbparser = NullParser()
 
-            if verb_abgrammar:
-                verb.abparser = lark.Lark(rules+verb_abgrammar)
+            if abgrammar:
+                verb.abparser = _compile_grammar(abgrammar, parser)
             else:
                 verb.abparser = NullParser()
 
@@ -282,8 +461,19 @@ class FeeParser:
         Args:
             filename: Name of the file to read.
         """
-        with open(filename, "r") as f:
-            data = f.read()
+        with open(filename, "rb") as f:
+            # Decode regular files straight out of a read-only mapping rather
+            # than reading the whole file into a bytes object first. Empty
+            # files can't be mapped, and pipes and the like can't be at all.
+            st = os.fstat(f.fileno())
+            if stat.S_ISREG(st.st_mode) and st.st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    data = str(m, "utf-8")
+            else:
+                data = f.read().decode("utf-8")
+        # Match the newline translation of text mode
+        if "\r" in data:
+            data = data.replace("\r\n", "\n").replace("\r", "\n")
         self.current_file = filename
         return self.parseString(data)
 
@@ -293,10 +483,20 @@ class FeeParser:
         Args:
             s: Layout rules in FEE format.
         """
-        return self.transformer.transform(self.parser.parse(s))
+        scratch = self.fontfeatures.scratch
+        if scratch.get("fee_font_caches") is self.font_caches:
+            # Nested parse, e.g. through Include
+            return self.transformer.transform(self.parser.parse(s))
+        self._reset_font_caches()
+        scratch["fee_font_caches"] = self.font_caches
+        try:
+            return self.transformer.transform(self.parser.parse(s))
+        finally:
+            scratch.pop("fee_font_caches", None)
+            self._reset_font_caches()
 
     def filterResults(self, results):
-        ret = [x for x in collapse(results) if x and not isinstance(x, str)]
+        ret = [x for x in _flatten(results) if x and not isinstance(x, str)]
         return ret
 
     def makeVarScalar(self, vsf):
@@ -330,9 +530,9 @@ class FeeTransformer(lark.Transformer):
             statements = [args[ti] for ti in tuple_idxs]
             before = args[:first_tuple_idx]
             after = args[last_tuple_idx+1:]
-            before_tree = requested_plugin.bbparser.parse(' '.join(before))
-            after_tree  = requested_plugin.abparser.parse(' '.join(after))
-            transformer = requested_plugin.transformer(self.parser)
+            before_tree = _parse_args(requested_plugin.bbparser, before)
+            after_tree  = _parse_args(requested_plugin.abparser, after)
+            transformer = requested_plugin.get_transformer(self.parser)
             ret = []
             if before_tree:
                 before_args = transformer.transform(before_tree)
@@ -348,8 +548,8 @@ class FeeTransformer(lark.Transformer):
             verb_ret = (verb, transformer.action(ret))
         # For normal plugins that don't take statements
         elif len(args) == 0 or isinstance(args[0], str):
-            tree = requested_plugin.parser.parse(' '.join(args))
-            verb_ret = (verb, requested_plugin.transformer(self.parser).transform(tree))
+            tree = _parse_args(requested_plugin.parser, args)
+            verb_ret = (verb, requested_plugin.get_transformer(self.parser).transform(tree))
         else:
             raise ValueError("Arguments of unknown type: {}".format(type(args)))
 
@@ -366,6 +566,16 @@ class FeeTransformer(lark.Transformer):
     def arg(self, args):
         return args[0].value
 
+# Glyph selector keys, by the token type they are built from.
+_TYPE_LOWER = {
+    "BARENAME": "barename",
+    "CLASSNAME": "classname",
+    "REGEX": "regex",
+    "UNICODEGLYPH": "unicodeglyph",
+    "UNICODERANGE": "unicoderange",
+    "INLINECLASS": "inlineclass",
+}
+
 def _UNICODEGLYPH(u):
     return int(u[2:], 16)
 
@@ -391,7 +601,10 @@ class FEEVerb(lark.Transformer):
         return self._get_metrics(glyph, metric)
 
     def glyphsuffix(self, args):
-        (suffixtype, suffix) = args[0].value, "".join([a.value for a in args[1:]])
+        if len(args) == 2:
+            (suffixtype, suffix) = args[0].value, args[1].value
+        else:
+            (suffixtype, suffix) = args[0].value, "".join(a.value for a in args[1:])
         return dict(suffixtype=suffixtype, suffix=suffix)
 
     def integer_container(self, args):
@@ -405,16 +618,17 @@ class FEEVerb(lark.Transformer):
         return lark.Token("INLINECLASS", [self._glyphselector(t) for t in args if t.type != "WS"])
 
     def _glyphselector(self, token):
-        if token.type == "CLASSNAME":
+        tokentype = token.type
+        if tokentype == "CLASSNAME":
             val = token.value[1:]
-        elif token.type == "REGEX":
+        elif tokentype == "REGEX":
             val = token.value[1:-1]
-        elif token.type == "UNICODEGLYPH":
+        elif tokentype == "UNICODEGLYPH":
             val = _UNICODEGLYPH(token.value)
         else:
             val = token.value
 
-        return {token.type.lower(): val}
+        return {_TYPE_LOWER.get(tokentype) or tokentype.lower(): val}
 
     def glyphselector(self, args):
         token, suffixes = args[0], args[1:]
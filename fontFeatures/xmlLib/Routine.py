@@ -4,15 +4,15 @@ from lxml import etree
 
 def toXML(self):
     """Serializes a Routine to a lxml Element object."""
-    root = etree.Element("routine")
+    attrs = {}
     if self.flags:
-        root.attrib["flags"] = str(self.flags)
+        attrs["flags"] = str(self.flags)
     if self.address:
-        root.attrib["address"] = str("|".join(self.address))
+        attrs["address"] = "|".join(self.address)
     if self.name:
-        root.attrib["name"] = self.name
-    for r in self.rules:
-        root.append(r.toXML())
+        attrs["name"] = self.name
+    root = etree.Element("routine", attrs)
+    root.extend(r.toXML() for r in self.rules)
 
     return root
 
@@ -22,9 +22,12 @@ def fromXML(klass, el):
     """Creates a Routine from a lxml Element object."""
     from fontFeatures import Rule
 
+    address = el.get("address")
+    flags = el.get("flags")
     rule = klass(
-        address=(el.get("address") or "").split("|"), name=el.get("name"), flags=(int(el.get("flags") or 0))
+        address=address.split("|") if address else None,
+        name=el.get("name"),
+        flags=int(flags) if flags else 0,
     )
-    for r in el:
-        rule.addRule(Rule.fromXML(r))
+    rule.rules.extend(Rule.fromXML(r) for r in el)
     return rule
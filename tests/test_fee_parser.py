@@ -1,5 +1,7 @@
 from fontFeatures.feeLib import FeeParser, GlyphSelector, FEEVerb
 from babelfont import Babelfont
+from fontFeatures.feeLib.util import compare
+from glyphtools import get_glyph_metrics, bin_glyphs_by_metric
 import lark
 from lark import Tree, Token
 import pytest
@@ -167,11 +169,89 @@ def test_classdefinition_with_conjunction(parser):
     matches = set(["{}.sc".format(c) for c in "ghijklmno"])
     assert set(parser.fontfeatures.namedClasses["conjunction"]) == matches
 
+def test_classdefinition_conjunction_order(parser):
+    s = """
+    DefineClass @abcd = [d c b a];
+    DefineClass @union = @abcd | [e a];
+    DefineClass @intersection = @abcd & [a b];
+    DefineClass @subtraction = @abcd - [c];
+    """
+    parser.parseString(s)
+    assert parser.fontfeatures.namedClasses["union"] == ["d", "c", "b", "a", "e"]
+    assert parser.fontfeatures.namedClasses["intersection"] == ["b", "a"]
+    assert parser.fontfeatures.namedClasses["subtraction"] == ["d", "b", "a"]
+
+def test_classdefinition_separate_parsers():
+    first, second = FeeParser(font), FeeParser(font)
+    first.parseString("DefineClass @one = [a];")
+    second.parseString("DefineClass @two = [b];")
+    assert list(first.fontfeatures.namedClasses) == ["one"]
+    assert list(second.fontfeatures.namedClasses) == ["two"]
+
+def test_export_changes_between_parses(parser):
+    parser.parseString(r"DefineClass @before = [a.sc]; DefineClass @rx_before = /^a\.s/;")
+    font["a.sc"].exported = False
+    try:
+        with pytest.warns(UserWarning):
+            parser.parseString(r"DefineClass @after = [a.sc]; DefineClass @rx_after = /^a\.s/;")
+    finally:
+        font["a.sc"].exported = True
+    classes = parser.fontfeatures.namedClasses
+    assert classes["before"] == ["a.sc"]
+    assert classes["after"] == []
+    assert "a.sc" in classes["rx_before"]
+    assert classes["rx_after"] == [g for g in classes["rx_before"] if g != "a.sc"]
+
+def test_metric_changes_between_parses(parser):
+    width = font["a"].width
+    parser.parseString("DefineClass @before = [a] & (width > 900);")
+    font["a"].width = 1000
+    try:
+        parser.parseString("DefineClass @after = [a] & (width > 900); DefineClass @wide = (width > 900);")
+    finally:
+        font["a"].width = width
+    classes = parser.fontfeatures.namedClasses
+    assert classes["before"] == []
+    assert classes["after"] == ["a"]
+    assert "a" in classes["wide"]
+
 def test_classdefinition_with_predicate(parser):
     s = r"DefineClass @foo = /\.sc$/ & (width > 500);"
     parser.parseString(s)
     assert len(parser.fontfeatures.namedClasses["foo"]) == 49
 
+def test_classdefinition_predicate_only(parser):
+    parser.parseString("DefineClass @wide = (width > 500); DefineClass @inked = (xMax == 0);")
+    expected = [g for g in font.glyphOrder if get_glyph_metrics(font, g)["width"] > 500]
+    assert parser.fontfeatures.namedClasses["wide"] == expected
+    expected = [g for g in font.glyphOrder if get_glyph_metrics(font, g)["xMax"]]
+    assert parser.fontfeatures.namedClasses["inked"] == expected
+
+def test_classdefinition_predicate_missing_metrics(parser):
+    # Glyphs with no outline have no side bearings
+    parser.parseString("DefineClass @lsb = (lsb > 10); DefineClass @rsb = (rsb < 10);")
+    for metric, comparator in (("lsb", ">"), ("rsb", "<")):
+        expected = [g for g in font.glyphOrder
+                    if compare(get_glyph_metrics(font, g)[metric], comparator, 10)]
+        assert parser.fontfeatures.namedClasses[metric] == expected
+
+def test_classdefinition_binned(parser):
+    parser.parseString("DefineClass @lc = /^[a-z]$/; DefineClassBinned @lc[width,4] = @lc;")
+    classes = parser.fontfeatures.namedClasses
+    expected = bin_glyphs_by_metric(font, classes["lc"], "width", bincount=4)
+    for i, (glyphs, _) in enumerate(expected):
+        assert classes["@lc_width%i" % (i + 1)] == tuple(glyphs)
+
+def test_classdefinition_binned_repeated_values(parser):
+    # zero, one and two share a width, so there are fewer distinct values
+    # than bins
+    parser.parseString("DefineClass @x = [zero one two a]; DefineClassBinned @x[width,3] = @x;")
+    classes = parser.fontfeatures.namedClasses
+    expected = bin_glyphs_by_metric(font, classes["x"], "width", bincount=3)
+    for i, (glyphs, _) in enumerate(expected):
+        assert classes["@x_width%i" % (i + 1)] == tuple(glyphs)
+    assert all(classes["@x_width%i" % (i + 1)] for i in range(3))
+
 #################
 # Substitutions #
 #################
@@ -190,3 +270,39 @@ def test_substitute2(parser):
     assert alltrim(parser.fontfeatures.asFea()) == alltrim(
         "feature rlig { lookup Routine_1 { ; sub [a b] by [c d]; } Routine_1; } rlig;"
     )
+
+#############
+# parseFile #
+#############
+
+def test_parsefile_newlines(parser, tmp_path):
+    path = tmp_path / "newlines.fee"
+    path.write_bytes(b"DefineClass @x = [a b];\r\nDefineClass @y = [c];\rDefineClass @z = [d];\n")
+    parser.parseFile(str(path))
+    classes = parser.fontfeatures.namedClasses
+    assert classes["x"] == ["a", "b"]
+    assert classes["y"] == ["c"]
+    assert classes["z"] == ["d"]
+
+def test_parsefile_empty(parser, tmp_path):
+    path = tmp_path / "empty.fee"
+    path.write_bytes(b"")
+    with pytest.raises(lark.exceptions.UnexpectedEOF):
+        parser.parseFile(str(path))
+
+def test_parsefile_not_utf8(parser, tmp_path):
+    path = tmp_path / "latin1.fee"
+    path.write_bytes("DefineClass @x = [é];".encode("latin-1"))
+    with pytest.raises(UnicodeDecodeError):
+        parser.parseFile(str(path))
+
+@pytest.mark.skipif(not os.path.isdir("/dev/fd"), reason="needs /dev/fd")
+def test_parsefile_pipe(parser):
+    r, w = os.pipe()
+    with os.fdopen(w, "wb") as f:
+        f.write(b"DefineClass @x = [a b];")
+    try:
+        parser.parseFile("/dev/fd/%i" % r)
+    finally:
+        os.close(r)
+    assert parser.fontfeatures.namedClasses["x"] == ["a", "b"]
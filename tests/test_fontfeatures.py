@@ -86,3 +86,9 @@ def test_routine_named():
     f1 = FontFeatures()
     f1.addFeature("onex", [r1])
     assert f1.routineNamed("One") == r1
+
+def test_routine_fromXML_roundtrip():
+    r = Routine.fromXML(etree.fromstring('<routine name="One"/>'))
+    assert not r.address
+    assert r.flags == 0
+    assert etree.tostring(r.toXML()).decode() == '<routine name="One"/>'